@@ -1,11 +1,24 @@
-import pandas as pd
-import scipy
 import numpy as np
 import requests
 import websockets
 import sys
+import time
 
 print(f"Python Version: {sys.version}")
-print(f"Pandas Version: {pd.__version__}")
-print(f"SciPy Version: {scipy.__version__}")
+print(f"NumPy Version: {np.__version__}")
+
+try:
+    import numba
+    print(f"Numba Version: {numba.__version__}")
+except ImportError:
+    print("Numba not installed - polar lookups will run as plain Python")
+
+# Build the polar model once. With numba this JIT-compiles the lookup
+# kernels into numba's on-disk cache, so the monitor itself starts
+# without a compile stall.
+from polars import BoatPerformance
+start = time.perf_counter()
+BoatPerformance()
+print(f"Polar model ready in {time.perf_counter() - start:.2f}s")
+
 print("All modules imported successfully. Ready for NMEA2000 logic.")
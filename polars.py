@@ -1,16 +1,135 @@
+import array
+import hashlib
+import os
+import pickle
 import numpy as np
-import pandas as pd
-from scipy.interpolate import LinearNDInterpolator
-import math
+
+# The kernels are compiled with cache=True: the first run (check_setup.py)
+# writes them to __pycache__ and later starts load the compiled code.
+try:
+    from numba import njit
+    _as_table = np.ascontiguousarray
+    _as_flat_table = np.frombuffer
+except ImportError:
+    # numba is optional. Without it the kernels below run as plain Python,
+    # which is faster on lists of floats than on ndarrays.
+    def njit(*args, **kwargs):
+        return lambda func: func
+    _as_table = np.ndarray.tolist
+    def _as_flat_table(buf):
+        return buf
+
+# Built lookup tables are cached here, keyed on the polar data. Bump
+# _MODEL_VERSION whenever _build_model changes how the table is built.
+_MODEL_VERSION = 1
+_CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'rpi-sailing', 'polar.pkl')
+
+
+@njit(cache=True, fastmath=True)
+def _grid_cell(grid, x):
+    """Index of the grid cell [grid[k], grid[k+1]] containing x"""
+    lo = 0
+    hi = len(grid) - 2
+    while lo < hi:
+        mid = (lo + hi + 1) >> 1
+        if grid[mid] <= x:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+@njit(cache=True, fastmath=True)
+def _polar_bilinear(tws, twa, tws_grid, twa_grid, vals, ncols, inv_dx, inv_dy, beat_angles):
+    """
+    Bilinear lookup of target speed in the (TWS, TWA) table.
+    vals is the table flattened row-major (one row per TWS, ncols wide).
+    """
+    # Handle symmetry (0-180)
+    twa = abs(twa)
+    if twa > 180.0:
+        twa = 360.0 - twa
+
+    # Clamp to the table. Outside the wind range (e.g. 30kts) we hold
+    # the nearest column rather than extrapolating.
+    tws = min(max(tws, tws_grid[0]), tws_grid[-1])
+    i = _grid_cell(tws_grid, tws)
+    fx = (tws - tws_grid[i]) * inv_dx[i]
+
+    # Inside the beat angle the boat is in irons: no target speed
+    if twa < beat_angles[i] + fx * (beat_angles[i + 1] - beat_angles[i]):
+        return 0.0
+
+    # Deeper than the last gybe angle we hold the deepest column
+    twa = min(max(twa, twa_grid[0]), twa_grid[-1])
+    j = _grid_cell(twa_grid, twa)
+    fy = (twa - twa_grid[j]) * inv_dy[j]
+
+    # Blend the four surrounding table entries
+    base = i * ncols + j
+    v00 = vals[base]
+    v01 = vals[base + 1]
+    v10 = vals[base + ncols]
+    v11 = vals[base + ncols + 1]
+    return ((1.0 - fx) * (1.0 - fy) * v00 + fx * (1.0 - fy) * v10
+            + (1.0 - fx) * fy * v01 + fx * fy * v11)
+
 
 class BoatPerformance:
     def __init__(self):
-        self.interpolator = self._build_model()
+        tws_grid, twa_grid, values, beat_angles = self._load_model()
+
+        self.tws_grid = _as_table(tws_grid)
+        self.twa_grid = _as_table(twa_grid)
+        # Flat row-major doubles: one small contiguous buffer for the lookup.
+        # numba reads it through a zero-copy ndarray view, which is cheaper
+        # for it to unbox than an array.array.
+        self._vals_flat = array.array('d', values.ravel())
+        self.vals = _as_flat_table(self._vals_flat)
+        self.ncols = values.shape[1]
+        self.tws_inv_dx = _as_table(1.0 / np.diff(tws_grid))
+        self.twa_inv_dx = _as_table(1.0 / np.diff(twa_grid))
+        self.beat_angle_arr = _as_table(beat_angles)
+
+        # Warm-up query so the JIT compile happens here, not on first use
+        self.get_target_speed(10.0, 90.0)
 
-    def _build_model(self):
+    def _load_model(self):
         """
-        Converts the static polar table (Sister Ship) into a 
-        LinearNDInterpolator model.
+        Returns the lookup table from the on-disk cache if it was built
+        from the same polar data, otherwise builds and caches it.
+        """
+        tws_cols, raw_data = self._polar_table()
+        key = hashlib.sha256(repr((_MODEL_VERSION, tws_cols, raw_data)).encode()).hexdigest()
+
+        try:
+            with open(_CACHE_PATH, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['key'] == key:
+                return cached['model']
+        except Exception:
+            pass  # Missing, stale or unreadable cache: rebuild
+
+        model = self._build_model(tws_cols, raw_data)
+
+        try:
+            # Write then rename, so another process never reads a partial file
+            os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+            tmp_path = f"{_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'key': key, 'model': model}, f)
+            os.replace(tmp_path, _CACHE_PATH)
+        except OSError as e:
+            print(f"Could not cache polar model: {e}")
+
+        return model
+
+    def _polar_table(self):
+        """
+        The static polar table (Sister Ship).
+        Returns (tws_cols, raw_data).
         """
         # 1. Define the columns (True Wind Speeds) from your image
         tws_cols = [4, 6, 8, 10, 12, 14, 16, 20, 24]
@@ -39,73 +158,86 @@ class BoatPerformance:
             'gybe_angle': [144.2, 144.2, 148.0, 149.3, 153.1, 159.0, 163.0, 176.2, 175.9]
         }
 
-        points = [] # (tws, twa)
-        values = [] # target_speed
-
-        for i, tws in enumerate(tws_cols):
-            # --- A. Process Beat (Upwind) ---
-            b_ang = raw_data['beat_angle'][i]
-            b_vmg = raw_data['beat_vmg'][i]
-            # Calculate Speed from VMG: Speed = VMG / cos(radians(angle))
-            b_spd = b_vmg / math.cos(math.radians(b_ang))
-            points.append((tws, b_ang))
-            values.append(b_spd)
-            # Add 0-angle boundary (Head to wind = 0 speed)
-            points.append((tws, 0))
-            values.append(0.0)
-
-            # --- B. Process Fixed Angles ---
-            for angle in [52, 60, 75, 90, 110, 120, 135, 150]:
-                spd = raw_data[angle][i]
-                points.append((tws, angle))
-                values.append(spd)
-
-            # --- C. Process Run (Downwind) ---
-            r_ang = raw_data['gybe_angle'][i]
-            r_vmg = raw_data['run_vmg'][i]
-            # Speed = VMG / cos(radians(180 - angle)) ? 
-            # Actually for VMG downwind, the formula is VMG = Spd * -cos(angle)
-            # So Spd = VMG / abs(cos(angle))
-            r_spd = r_vmg / abs(math.cos(math.radians(r_ang)))
-            points.append((tws, r_ang))
-            values.append(r_spd)
-            # Add 180-angle boundary (Dead downwind). 
-            # We approximate dead run speed slightly less than gybe speed if not provided,
-            # but linear interpolation between gybe angles works fine here.
-            points.append((tws, 180))
-            values.append(r_spd * 0.95) # Slight penalty for dead downwind if not specified
-
-        # Create the triangulation model
-        # Fill_value=0 means if we are outside the wind range (e.g. 30kts), return 0 
-        # (or we could handle extrapolation later)
-        return LinearNDInterpolator(points, values, fill_value=0)
+        return tws_cols, raw_data
+
+    def _build_model(self, tws_cols, raw_data):
+        """
+        Converts the static polar table into a 
+        rectangular lookup table over (TWS, TWA).
+        Returns (tws_grid, twa_grid, values, beat_angles).
+        The table spans the beat angle to the gybe angle; TWA outside
+        that range is handled in the lookup itself.
+        """
+        # Each TWS row is a piecewise-linear speed profile over TWA. The beat
+        # and gybe angles move with wind speed, so the TWA axis of the grid is
+        # the union of every row's breakpoints; sampling each row at all of
+        # them keeps every row exact while giving a rectangular table.
+
+        # Beat and run speeds for every TWS at once
+        b_ang = np.asarray(raw_data['beat_angle'], dtype=np.float64)
+        b_vmg = np.asarray(raw_data['beat_vmg'], dtype=np.float64)
+        # Calculate Speed from VMG: Speed = VMG / cos(radians(angle))
+        b_spd = b_vmg / np.cos(np.deg2rad(b_ang))
+
+        r_ang = np.asarray(raw_data['gybe_angle'], dtype=np.float64)
+        r_vmg = np.asarray(raw_data['run_vmg'], dtype=np.float64)
+        # Speed = VMG / cos(radians(180 - angle)) ? 
+        # Actually for VMG downwind, the formula is VMG = Spd * -cos(angle)
+        # So Spd = VMG / abs(cos(angle))
+        r_spd = r_vmg / np.abs(np.cos(np.deg2rad(r_ang)))
+
+        # Fixed Angles: one row per TWS, one column per angle
+        fixed_angles = [52, 60, 75, 90, 110, 120, 135, 150]
+        fixed_spd = np.array([raw_data[angle] for angle in fixed_angles], dtype=np.float64).T
+
+        # Row breakpoints: beat, fixed angles, run
+        n_tws = len(tws_cols)
+        fixed_ang = np.tile(np.asarray(fixed_angles, dtype=np.float64), (n_tws, 1))
+        angles = np.column_stack([b_ang, fixed_ang, r_ang])
+        speeds = np.column_stack([b_spd, fixed_spd, r_spd])
+
+        # The gybe angle can fall below 150 in light air, so sort each row
+        order = np.argsort(angles, axis=1, kind='stable')
+        angles = np.take_along_axis(angles, order, axis=1)
+        speeds = np.take_along_axis(speeds, order, axis=1)
+
+        tws_grid = np.asarray(tws_cols, dtype=np.float64)
+        twa_grid = np.unique(angles)
+
+        # Sample every row on the shared TWA axis (np.interp, for all rows
+        # at once): find each row's segment, then blend its end points,
+        # holding the end values beyond the row's first/last breakpoint
+        seg = (angles[:, :, None] <= twa_grid).sum(axis=1) - 1
+        seg = np.clip(seg, 0, angles.shape[1] - 2)
+        x0 = np.take_along_axis(angles, seg, axis=1)
+        x1 = np.take_along_axis(angles, seg + 1, axis=1)
+        y0 = np.take_along_axis(speeds, seg, axis=1)
+        y1 = np.take_along_axis(speeds, seg + 1, axis=1)
+        dx = x1 - x0
+        t = np.divide(twa_grid - x0, dx, out=np.zeros_like(dx), where=dx > 0)
+        values = y0 + np.clip(t, 0.0, 1.0) * (y1 - y0)
+
+        return tws_grid, twa_grid, values, b_ang
 
     def get_target_speed(self, tws, twa):
         """
         Returns theoretical hull speed.
         Handles TWA > 180 (port/starboard symmetry).
+        Returns 0 inside the beat angle (no-go zone).
         """
-        # Sanitize inputs
-        if pd.isna(tws) or pd.isna(twa):
+        # Sanitize inputs (NaN is the only value not equal to itself)
+        if tws is None or twa is None or tws != tws or twa != twa:
             return None
         
-        # Handle symmetry (0-180)
-        twa = abs(twa)
-        if twa > 180:
-            twa = 360 - twa
-            
-        # Query the model
-        # The interpolator expects an array of points
-        res = self.interpolator([tws, twa])[0]
-        
-        # Float conversion (numpy float to python float)
-        return float(res)
+        return _polar_bilinear(float(tws), float(twa), self.tws_grid, self.twa_grid,
+                               self.vals, self.ncols, self.tws_inv_dx, self.twa_inv_dx,
+                               self.beat_angle_arr)
 
     def calculate_efficiency(self, tws, twa, stw):
         target = self.get_target_speed(tws, twa)
         
-        if target <= 0.5: # Avoid division by zero in light air/calm
-            return 0.0
+        if target <= 0.5: # Avoid division by zero in light air/calm (or in irons)
+            return 0.0, target
             
         efficiency = (stw / target) * 100.0
         
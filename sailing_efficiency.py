@@ -12,15 +12,46 @@ import math
 import serial
 import struct
 import time
-from collections import deque
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional
 
 # Import the polar model
 from polars import BoatPerformance
 
+try:
+    # orjson is optional but parses small Signal K deltas several times faster
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
-@dataclass
+# Signal K reports SI units
+_RAD2DEG = 57.29577951308232  # radians -> degrees
+_MS2KT = 1.94384              # m/s -> knots
+
+# Two-digit uppercase hex for every byte value, for RAW frame formatting
+_HEX_TABLE = [f'{b:02X}' for b in range(256)]
+
+# PGN 127489 payload with every optional field set to N/A (0xFF or 0xFFFF).
+# Bytes 0 (engine instance) and 24 (engine load) are filled in per message.
+_PGN_127489_TEMPLATE = bytes(
+    b'\x00'                           # Engine Instance
+    + struct.pack('<H', 0xFFFF)       # Oil Pressure
+    + struct.pack('<H', 0xFFFF)       # Oil Temperature
+    + struct.pack('<H', 0xFFFF)       # Engine Temperature
+    + struct.pack('<H', 0xFFFF)       # Alternator Potential
+    + struct.pack('<h', 0x7FFF)       # Fuel Rate (signed)
+    + struct.pack('<I', 0xFFFFFFFF)   # Total Engine Hours
+    + struct.pack('<H', 0xFFFF)       # Coolant Pressure
+    + struct.pack('<H', 0xFFFF)       # Fuel Pressure
+    + bytes([0xFF, 0xFF, 0xFF, 0xFF]) # Reserved
+    + b'\x00'                         # Discrete Status 1 (no warnings)
+    + b'\x00'                         # Engine Load %
+    + b'\x7F'                         # Engine Torque % (N/A for signed byte)
+)
+
+
+@dataclass(slots=True)
 class SailingData:
     """Container for current sailing telemetry"""
     stw: float = 0.0   # Speed Through Water (knots)
@@ -47,6 +78,13 @@ class NMEA2000Gateway:
         self.source_address = source_address
         self.serial = None
         self.sequence_counter = 0  # For fast-packet framing
+
+        # The engine-load PGN always goes out with the same priority, source
+        # and destination, so its CAN ID and RAW header fields are fixed
+        self._priority = 6
+        self._can_id_127489 = self._build_can_id(self.PGN_ENGINE_DYNAMIC, self._priority)
+        self._raw_fields_127489 = "%d,%d,%d,%d" % (
+            self._priority, self.PGN_ENGINE_DYNAMIC, source_address, 255)
         
     def connect(self):
         """Open serial connection to the gateway"""
@@ -95,27 +133,25 @@ class NMEA2000Gateway:
         # Clamp efficiency to valid range (0-125% mapped to 0-125)
         load_value = int(min(max(engine_load_percent, 0), 125))
         
-        data = bytearray(26)
-        
-        # Engine Instance
-        data[0] = engine_instance
-        
-        # Set all optional fields to N/A (0xFF or 0xFFFF)
-        data[1:3] = struct.pack('<H', 0xFFFF)   # Oil Pressure
-        data[3:5] = struct.pack('<H', 0xFFFF)   # Oil Temperature  
-        data[5:7] = struct.pack('<H', 0xFFFF)   # Engine Temperature
-        data[7:9] = struct.pack('<H', 0xFFFF)   # Alternator Potential
-        data[9:11] = struct.pack('<h', 0x7FFF)  # Fuel Rate (signed)
-        data[11:15] = struct.pack('<I', 0xFFFFFFFF)  # Total Engine Hours
-        data[15:17] = struct.pack('<H', 0xFFFF) # Coolant Pressure
-        data[17:19] = struct.pack('<H', 0xFFFF) # Fuel Pressure
-        data[19:23] = bytes([0xFF, 0xFF, 0xFF, 0xFF])  # Reserved
-        data[23] = 0x00  # Discrete Status 1 (no warnings)
-        data[24] = load_value  # Engine Load %
-        data[25] = 0x7F  # Engine Torque % (N/A for signed byte)
+        # Only the instance and the load byte change; the rest is N/A
+        data = bytearray(_PGN_127489_TEMPLATE)
+        data[0] = engine_instance  # Engine Instance
+        data[24] = load_value      # Engine Load %
         
         return bytes(data)
     
+    def _build_can_id(self, pgn: int, priority: int) -> int:
+        """
+        Build CAN ID: Priority(3) + Reserved(1) + DP(1) + PF(8) + PS(8) + SA(8)
+        """
+        # PGN 127489 = 0x1F201 -> PF=0xF2, PS=0x01, DP=1
+        # For broadcast: destination = 255
+        pf = (pgn >> 8) & 0xFF
+        ps = pgn & 0xFF if pf >= 240 else 255  # PDU2 format for this PGN
+        dp = (pgn >> 16) & 0x01
+        
+        return ((priority & 0x07) << 26) | (dp << 24) | (pf << 16) | (ps << 8) | self.source_address
+    
     def _build_fast_packet_frames(self, pgn: int, data: bytes, priority: int = 6) -> list:
         """
         Build fast-packet frames for multi-frame PGN transmission.
@@ -129,14 +165,10 @@ class NMEA2000Gateway:
         frames = []
         total_bytes = len(data)
         
-        # Build CAN ID: Priority(3) + Reserved(1) + DP(1) + PF(8) + PS(8) + SA(8)
-        # PGN 127489 = 0x1F201 -> PF=0xF2, PS=0x01, DP=1
-        # For broadcast: destination = 255
-        pf = (pgn >> 8) & 0xFF
-        ps = pgn & 0xFF if pf >= 240 else 255  # PDU2 format for this PGN
-        dp = (pgn >> 16) & 0x01
-        
-        can_id = ((priority & 0x07) << 26) | (dp << 24) | (pf << 16) | (ps << 8) | self.source_address
+        if pgn == self.PGN_ENGINE_DYNAMIC and priority == self._priority:
+            can_id = self._can_id_127489
+        else:
+            can_id = self._build_can_id(pgn, priority)
         
         # Increment sequence counter (0-7)
         seq = self.sequence_counter
@@ -184,21 +216,20 @@ class NMEA2000Gateway:
             # Build fast-packet frames
             frames = self._build_fast_packet_frames(self.PGN_ENGINE_DYNAMIC, payload)
             
-            # Send each frame in RAW format
+            # Format each frame in RAW format
             # RAW format: timestamp,prio,pgn,src,dst,len,data_hex
             timestamp = int(time.time() * 1000) % 86400000  # ms since midnight
             
+            raw_msgs = []
             for can_id, frame_data in frames:
-                # Extract components from CAN ID for RAW format
-                priority = (can_id >> 26) & 0x07
-                pgn = self.PGN_ENGINE_DYNAMIC
-                dst = 255  # Broadcast
-                
                 # Format: TIMESTAMP,PRIO,PGN,SRC,DST,LEN,DATA
-                hex_data = ','.join(f'{b:02X}' for b in frame_data)
-                raw_msg = f"{timestamp},{priority},{pgn},{self.source_address},{dst},{len(frame_data)},{hex_data}\r\n"
-                
-                self.serial.write(raw_msg.encode('ascii'))
+                # PRIO,PGN,SRC,DST are fixed for this PGN (broadcast)
+                hex_data = ','.join([_HEX_TABLE[b] for b in frame_data])
+                raw_msgs.append("%d,%s,%d,%s\r\n" % (
+                    timestamp, self._raw_fields_127489, len(frame_data), hex_data))
+            
+            # Send all frames of the fast packet in a single write
+            self.serial.write(''.join(raw_msgs).encode('ascii'))
                 
             return True
             
@@ -216,13 +247,15 @@ class SailingEfficiencyMonitor:
                  signalk_uri: str = "ws://localhost:3000/signalk/v1/stream?subscribe=none",
                  n2k_port: str = '/dev/ttyACM0',
                  averaging_window: float = 10.0,
-                 update_interval: float = 1.0):
+                 update_interval: float = 1.0,
+                 buffer_size: int = 1000):
         """
         Args:
             signalk_uri: Signal K WebSocket URI
             n2k_port: Serial port for YDNU-02 gateway
             averaging_window: Seconds of data to average
             update_interval: Seconds between N2K transmissions
+            buffer_size: Number of samples kept in the ring buffer
         """
         self.signalk_uri = signalk_uri
         self.averaging_window = averaging_window
@@ -230,9 +263,36 @@ class SailingEfficiencyMonitor:
         
         self.polar_model = BoatPerformance()
         self.gateway = NMEA2000Gateway(port=n2k_port)
-        self.data_buffer: deque = deque(maxlen=1000)
+        # Serial writes block, so they run on a dedicated thread to keep the
+        # event loop (and the Signal K receive task) turning. One worker keeps
+        # frames in order and the fast-packet sequence counter consistent.
+        self._tx_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='n2k-tx')
         self.current_data = SailingData()
         self.running = False
+
+        # Signal K path -> (SailingData field, unit conversion factor)
+        self._path_handlers = {
+            "navigation.speedThroughWater": ("stw", _MS2KT),
+            "environment.wind.angleTrueWater": ("twa", _RAD2DEG),
+            "environment.wind.speedTrue": ("tws", _MS2KT),
+        }
+
+        # Sample history as a ring buffer of parallel arrays (one per field).
+        # The averaging window is the newest _count samples; running sums
+        # over the window are updated as samples enter and leave it.
+        # TWA is stored as sin/cos so it can be averaged across the 0/360 wrap.
+        self._capacity = buffer_size
+        self._stw = np.zeros(buffer_size, dtype=np.float64)
+        self._sin_twa = np.zeros(buffer_size, dtype=np.float64)
+        self._cos_twa = np.zeros(buffer_size, dtype=np.float64)
+        self._tws = np.zeros(buffer_size, dtype=np.float64)
+        self._ts = np.zeros(buffer_size, dtype=np.float64)
+        self._idx = 0     # Next slot to write
+        self._count = 0   # Number of samples in the window
+        self._sum_stw = 0.0
+        self._sum_sin_twa = 0.0
+        self._sum_cos_twa = 0.0
+        self._sum_tws = 0.0
         
     async def _subscribe_signalk(self, websocket):
         """Subscribe to required Signal K paths"""
@@ -246,42 +306,59 @@ class SailingEfficiencyMonitor:
         }
         await websocket.send(json.dumps(subscribe_msg))
         
-    def _rad_to_deg(self, radians: Optional[float]) -> float:
-        """Convert radians to degrees"""
-        if radians is None:
-            return 0.0
-        return radians * (180 / math.pi)
-    
-    def _ms_to_knots(self, ms: Optional[float]) -> float:
-        """Convert m/s to knots"""
-        if ms is None:
-            return 0.0
-        return ms * 1.94384
-    
     def _process_signalk_update(self, data: dict):
         """Process Signal K delta update"""
         if 'updates' not in data:
             return
             
+        handlers = self._path_handlers
         for update in data['updates']:
             for value in update.get('values', []):
-                path = value.get('path')
-                val = value.get('value')
-                
-                if path == "navigation.speedThroughWater":
-                    self.current_data.stw = self._ms_to_knots(val)
-                elif path == "environment.wind.angleTrueWater":
-                    self.current_data.twa = self._rad_to_deg(val)
-                elif path == "environment.wind.speedTrue":
-                    self.current_data.tws = self._ms_to_knots(val)
+                handler = handlers.get(value.get('path'))
+                if handler:
+                    field, scale = handler
+                    val = value.get('value')
+                    setattr(self.current_data, field, 0.0 if val is None else val * scale)
                     
         self.current_data.timestamp = time.time()
-        self.data_buffer.append(SailingData(
-            stw=self.current_data.stw,
-            twa=self.current_data.twa,
-            tws=self.current_data.tws,
-            timestamp=self.current_data.timestamp
-        ))
+        self._push_sample(self.current_data)
+    
+    def _push_sample(self, sample: SailingData):
+        """Append a sample to the ring buffer and the running sums"""
+        idx = self._idx
+        
+        # A full ring overwrites the oldest sample, which leaves the window
+        if self._count == self._capacity:
+            self._drop_oldest()
+        
+        twa_rad = math.radians(sample.twa)
+        sin_twa = math.sin(twa_rad)
+        cos_twa = math.cos(twa_rad)
+        
+        self._stw[idx] = sample.stw
+        self._sin_twa[idx] = sin_twa
+        self._cos_twa[idx] = cos_twa
+        self._tws[idx] = sample.tws
+        self._ts[idx] = sample.timestamp
+        self._sum_stw += sample.stw
+        self._sum_sin_twa += sin_twa
+        self._sum_cos_twa += cos_twa
+        self._sum_tws += sample.tws
+        self._idx = (idx + 1) % self._capacity
+        self._count += 1
+    
+    def _drop_oldest(self):
+        """Remove the oldest sample from the window"""
+        slot = (self._idx - self._count) % self._capacity
+        self._count -= 1
+        if self._count == 0:
+            # Window is empty: reset rather than carry rounding error
+            self._sum_stw = self._sum_sin_twa = self._sum_cos_twa = self._sum_tws = 0.0
+        else:
+            self._sum_stw -= self._stw.item(slot)
+            self._sum_sin_twa -= self._sin_twa.item(slot)
+            self._sum_cos_twa -= self._cos_twa.item(slot)
+            self._sum_tws -= self._tws.item(slot)
     
     def _calculate_averaged_efficiency(self) -> tuple:
         """
@@ -291,16 +368,20 @@ class SailingEfficiencyMonitor:
         now = time.time()
         cutoff = now - self.averaging_window
         
-        # Filter recent data
-        recent = [d for d in self.data_buffer if d.timestamp >= cutoff]
+        # Expire samples older than the window (oldest first)
+        ts = self._ts
+        while self._count and ts.item((self._idx - self._count) % self._capacity) < cutoff:
+            self._drop_oldest()
         
-        if not recent:
+        n = self._count
+        if n == 0:
             return 0.0, 0.0, 0.0, 0.0, 0.0
         
         # Calculate averages
-        avg_stw = sum(d.stw for d in recent) / len(recent)
-        avg_twa = sum(d.twa for d in recent) / len(recent)
-        avg_tws = sum(d.tws for d in recent) / len(recent)
+        avg_stw = self._sum_stw / n
+        avg_tws = self._sum_tws / n
+        # Circular mean: 359 and 1 average to 0, not 180
+        avg_twa = math.degrees(math.atan2(self._sum_sin_twa, self._sum_cos_twa))
         
         # Calculate efficiency
         try:
@@ -314,17 +395,21 @@ class SailingEfficiencyMonitor:
         """Coroutine to listen to Signal K updates"""
         while self.running:
             try:
-                async with websockets.connect(self.signalk_uri) as websocket:
+                # Dead connections are detected by the library's ping/pong
+                # keep-alive, which raises ConnectionClosed and reconnects
+                async with websockets.connect(self.signalk_uri,
+                                              ping_interval=20,
+                                              ping_timeout=10,
+                                              close_timeout=1) as websocket:
                     print("Connected to Signal K")
                     await self._subscribe_signalk(websocket)
                     
-                    while self.running:
+                    async for message in websocket:
+                        if not self.running:
+                            break
                         try:
-                            message = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                            data = json.loads(message)
+                            data = json_loads(message)
                             self._process_signalk_update(data)
-                        except asyncio.TimeoutError:
-                            continue
                         except Exception as e:
                             print(f"Signal K receive error: {e}")
                             break
@@ -336,12 +421,14 @@ class SailingEfficiencyMonitor:
     
     async def _n2k_transmitter(self):
         """Coroutine to periodically transmit efficiency to N2K"""
+        loop = asyncio.get_running_loop()
         while self.running:
             try:
                 efficiency, target, stw, twa, tws = self._calculate_averaged_efficiency()
                 
                 # Send to N2K network
-                self.gateway.send_engine_load(efficiency)
+                await loop.run_in_executor(self._tx_executor,
+                                           self.gateway.send_engine_load, efficiency)
                 
                 # Console output
                 print(f"TWS: {tws:5.1f}kt | TWA: {twa:5.1f}° | STW: {stw:5.1f}kt | "
@@ -375,6 +462,8 @@ class SailingEfficiencyMonitor:
             print("\nShutting down...")
         finally:
             self.running = False
+            # Let any in-flight write finish before closing the port
+            self._tx_executor.shutdown(wait=True)
             self.gateway.disconnect()
 
 
@@ -1,6 +1,6 @@
-import pandas as pd
 import numpy as np
 import time
+from collections import deque
 from polars import BoatPerformance
 
 def run_simulation():
@@ -11,9 +11,12 @@ def run_simulation():
     print(f"{'TWS (kt)':<10} {'TWA (deg)':<10} {'STW (kt)':<10} || {'Target':<10} {'Efficiency':<10}")
     print("-" * 60)
 
-    # Create a fake rolling buffer
+    # Create a fake rolling buffer of (timestamp, tws, twa, stw) tuples
     # We will simulate 10 seconds of data arriving
-    buffer = []
+    # Running sums let us average without re-scanning the buffer
+    buffer = deque()
+    window = 10.0
+    sum_tws = sum_twa = sum_stw = 0.0
 
     try:
         while True:
@@ -25,26 +28,26 @@ def run_simulation():
             # Let's pretend we are sailing at 6.8 knots (Sister ship target is ~6.64 at 52 deg)
             mock_stw = np.random.normal(6.8, 0.2)
 
-            # 2. Add to rolling buffer (List of dictionaries)
-            buffer.append({
-                'timestamp': pd.Timestamp.now(),
-                'tws': mock_tws,
-                'twa': mock_twa,
-                'stw': mock_stw
-            })
+            # 2. Add to rolling buffer
+            buffer.append((time.monotonic(), mock_tws, mock_twa, mock_stw))
+            sum_tws += mock_tws
+            sum_twa += mock_twa
+            sum_stw += mock_stw
 
             # 3. Keep only last 10 seconds
-            now = pd.Timestamp.now()
-            buffer = [b for b in buffer if (now - b['timestamp']).total_seconds() <= 10]
+            cutoff = time.monotonic() - window
+            while buffer and buffer[0][0] < cutoff:
+                _, old_tws, old_twa, old_stw = buffer.popleft()
+                sum_tws -= old_tws
+                sum_twa -= old_twa
+                sum_stw -= old_stw
             
             # 4. Every 5 loops (approx 1 sec in this fake loop), calculate stats
-            # Convert to DataFrame for easy averaging
-            df = pd.DataFrame(buffer)
-            
-            if not df.empty:
-                avg_tws = df['tws'].mean()
-                avg_twa = df['twa'].mean()
-                avg_stw = df['stw'].mean()
+            if buffer:
+                n = len(buffer)
+                avg_tws = sum_tws / n
+                avg_twa = sum_twa / n
+                avg_stw = sum_stw / n
 
                 # Calculate Performance
                 eff_percent, target_spd = perf.calculate_efficiency(avg_tws, avg_twa, avg_stw)